@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+"""Compare the encoded size and speed of the packagers on a batch of samples."""
+# ---------------------------------------------------------------------------
+
+import random
+import timeit
+
+from buffered import (
+    JSONPackager,
+    PicklerPackager,
+    SeparatorPackager,
+    TimeSeriesPackager,
+)
+
+
+def make_samples(count=10000, series=("cpu", "memory", "disk", "network")):
+    # Regularly spaced timestamps and slowly changing values, interleaved by series
+    random.seed(0)
+    values = {name: random.random() for name in series}
+    samples = []
+    for i in range(count):
+        name = series[i % len(series)]
+        values[name] = round(values[name] + random.choice((-0.01, 0, 0, 0.01)), 2)
+        samples.append((name, values[name], 1622555555.0 + i // len(series)))
+    return samples
+
+
+def main(count=10000, repeat=5):
+    samples = make_samples(count)
+    packagers = {
+        "SeparatorPackager": SeparatorPackager(),
+        "JSONPackager": JSONPackager(),
+        "PicklerPackager": PicklerPackager(terminator=b"\n"),
+        "TimeSeriesPackager": TimeSeriesPackager(),
+    }
+    print(f"{count} samples, best of {repeat}")
+    print(f"{'packager':<20}{'bytes':>10}{'bytes/sample':>14}{'pack ms':>10}{'unpack ms':>11}")
+    for name, packager in packagers.items():
+        packed = packager.pack(samples)
+        pack_time = min(timeit.repeat(lambda: packager.pack(samples), number=1, repeat=repeat))
+        unpack_time = min(timeit.repeat(lambda: packager.unpack(packed), number=1, repeat=repeat))
+        print(
+            f"{name:<20}{len(packed):>10}{len(packed) / count:>14.2f}"
+            f"{pack_time * 1000:>10.1f}{unpack_time * 1000:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,26 @@ __version__ = "1.0.1"
 from buffered.buffer import (
     Buffer,
     PackagedBuffer,
+    PackagedBufferReader,
 )
 from buffered.packager import (
     Packager,
     SeparatorPackager,
     PicklerPackager,
     JSONPackager,
+    TimeSeriesPackager,
+    RecordCodec,
 )
+from buffered.receiver import (
+    PackagedReceiverProtocol,
+    start_receiver,
+)
+from buffered.broadcast import (
+    BroadcastBuffer,
+    BroadcastConsumer,
+)
+from buffered.capture import (
+    CaptureWriter,
+    CaptureReader,
+)
+from buffered.window import DeliveryWindow
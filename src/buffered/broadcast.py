@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+"""
+Broadcast buffers for the Buffered package.
+
+The BroadcastBuffer class stores each record once, and delivers it to every
+registered BroadcastConsumer, each of which reads from its own cursor.
+
+"""
+# ---------------------------------------------------------------------------
+
+from collections import deque
+from itertools import islice
+import logging
+from typing import Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastConsumer:
+    """
+    A reader of a BroadcastBuffer with its own cursor
+
+    Args:
+        source (BroadcastBuffer): The buffer to read records from.
+        name (str): The name the consumer is registered under.
+        cursor (int): The sequence number of the next record to read.
+
+    """
+
+    def __init__(self, source: "BroadcastBuffer", name: str, cursor: int) -> None:
+        self.source = source
+        self.name = name
+        self.cursor = cursor
+        self.missed = 0
+        self.active = True
+
+    @property
+    def lag(self) -> int:
+        # Number of records stored that this consumer has not read yet
+        if not self.active:
+            return 0
+        return self.source.next_seq - self.cursor
+
+    def size(self) -> int:
+        return self.lag
+
+    def empty(self) -> bool:
+        return self.lag == 0
+
+    def not_empty(self) -> bool:
+        return self.lag > 0
+
+    def peek(self) -> Any:
+        if self.empty():
+            return None
+        return self.source._records[self.cursor - self.source._start]
+
+    def get(self) -> Any:
+        if self.empty():
+            return None
+        item = self.source._records[self.cursor - self.source._start]
+        self.cursor += 1
+        self.source._release()
+        return item
+
+    def dump(self, max: Optional[int] = None) -> list:
+        if self.empty():
+            return []
+        max = max or self.lag
+        length = min(max, self.lag)
+        offset = self.cursor - self.source._start
+        items = list(islice(self.source._records, offset, offset + length))
+        self.cursor += length
+        self.source._release()
+        return items
+
+    def __len__(self) -> int:
+        return self.lag
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name}, seq={self.cursor}, lag={self.lag}, missed={self.missed})"
+
+
+class BroadcastBuffer:
+    """
+    A buffer that delivers every record to each of its registered consumers
+
+    Records are stored once, numbered in sequence, and freed once every consumer
+    has read them. When the buffer is full, consumers that have not yet read the
+    oldest record are either moved past it, counting it as missed (policy "lag"),
+    or unregistered (policy "drop").
+
+    While no consumers are registered, a bounded buffer keeps its newest records
+    for consumers that register later. An unbounded buffer keeps none, and put
+    returns each record as evicted, so that it cannot grow without limit.
+
+    Args:
+        maxlen (int, optional): The maximum number of records stored, or None for no limit. Defaults to 4096.
+        policy (str, optional): What to do with consumers that fall too far behind. Defaults to "lag".
+
+    """
+
+    policies = ("lag", "drop")
+
+    def __init__(self, maxlen: Optional[int] = 4096, policy: str = "lag") -> None:
+        if policy not in self.policies:
+            raise ValueError(f"Policy must be one of {self.policies}, not {policy!r}")
+        self.maxlen = maxlen
+        self.policy = policy
+        self._records = deque()
+        self._start = 0
+        self._consumers = {}
+
+    @property
+    def next_seq(self) -> int:
+        # Sequence number that the next record put into the buffer will be given
+        return self._start + len(self._records)
+
+    @property
+    def consumers(self) -> dict:
+        return dict(self._consumers)
+
+    def register(self, name: str, from_oldest: bool = True) -> BroadcastConsumer:
+        if name in self._consumers:
+            raise ValueError(f"Consumer {name!r} is already registered")
+        cursor = self._start if from_oldest else self.next_seq
+        consumer = BroadcastConsumer(self, name, cursor)
+        self._consumers[name] = consumer
+        return consumer
+
+    def unregister(self, name: str) -> None:
+        consumer = self._consumers.pop(name)
+        consumer.active = False
+        self._release()
+
+    def _make_room(self) -> list:
+        evicted = []
+        while self._records and self.full():
+            for consumer in list(self._consumers.values()):
+                if consumer.cursor > self._start:
+                    continue
+                if self.policy == "drop":
+                    logger.warning(
+                        f"{self.__class__.__name__} dropped consumer {consumer.name} lagging by {consumer.lag} records"
+                    )
+                    self._consumers.pop(consumer.name)
+                    consumer.active = False
+                else:
+                    consumer.cursor += 1
+                    consumer.missed += 1
+            evicted.append(self._records.popleft())
+            self._start += 1
+        return evicted
+
+    def _release(self) -> None:
+        # Free the records that every consumer has read
+        if self._consumers:
+            slowest = min(consumer.cursor for consumer in self._consumers.values())
+        elif self.maxlen is None:
+            slowest = self.next_seq
+        else:
+            return
+        while self._start < slowest:
+            self._records.popleft()
+            self._start += 1
+
+    def put(self, data: Any) -> list:
+        if self.maxlen is None and not self._consumers:
+            # Nothing would ever read or evict the record
+            self._start += 1
+            return [data]
+        evicted = self._make_room()
+        self._records.append(data)
+        return evicted
+
+    def put_many(self, data: Iterable) -> list:
+        evicted = []
+        for item in data:
+            evicted += self.put(item)
+        return evicted
+
+    def size(self) -> int:
+        return len(self._records)
+
+    def full(self) -> bool:
+        return self.maxlen is not None and self.size() >= self.maxlen
+
+    def empty(self) -> bool:
+        return self.size() == 0
+
+    def not_empty(self) -> bool:
+        return self.size() > 0
+
+    def __len__(self) -> int:
+        return self.size()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(seq={self._start}...{self.next_seq}, "
+            f"len={self.size()}/{self.maxlen}, consumers={len(self._consumers)})"
+        )
+
+    def __str__(self) -> str:
+        return self.__repr__()
@@ -16,50 +16,286 @@ The Buffer class is a simple buffer that stores data in a deque.
 # ---------------------------------------------------------------------------
 
 from collections import deque
+from concurrent.futures import Executor
+import io
 import logging
+import sys
 from copy import deepcopy
-from typing import Any, Callable, Optional
-from dataclasses import is_dataclass
-
-from buffered.packager import Packager, JSONPackager
+from itertools import islice, repeat
+import math
+import os
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+from buffered.packager import Packager, JSONPackager, is_record
 
 logger = logging.getLogger(__name__)
 
 
+def _rebuild_buffer(cls: type, maxlen: Optional[int]) -> "Buffer":
+    # Module level so that pickle can find it. The state is restored by __setstate__
+    buffer = deque.__new__(cls)
+    deque.__init__(buffer, maxlen=maxlen)
+    return buffer
+
+
 class Buffer(deque):
     """
     A buffer class that stores data in a deque
 
+    When the buffer is full, the oldest records are evicted to make room for new
+    ones. put, putback and put_many return the records that were evicted.
+
     Args:
         data (list, tuple, set, dict, optional): Data to initialize the buffer with. Defaults to None.
         maxlen (int, optional): The maximum length of the buffer. Defaults to 4096.
+        max_bytes (int, optional): The maximum total size of the records in the buffer. Defaults to None.
+        sizer (Callable, optional): Returns the size of a record in bytes. Required with max_bytes,
+            otherwise defaults to sys.getsizeof.
 
     """
 
-    def __init__(self, data: Optional[Any] = None, maxlen: int = 4096) -> None:
+    def __init__(
+        self,
+        data: Optional[Any] = None,
+        maxlen: int = 4096,
+        max_bytes: Optional[int] = None,
+        sizer: Optional[Callable[[Any], int]] = None,
+    ) -> None:
         data = data or []
-        super().__init__(data, maxlen=maxlen)
+        if max_bytes is not None and sizer is None:
+            # sys.getsizeof does not count the contents of a record, such as a dict
+            raise ValueError("A sizer must be given to bound a buffer by max_bytes")
+        self.max_bytes = max_bytes
+        self.sizer = sizer or sys.getsizeof
+        # Only keep a running total of the record sizes if a budget or sizer is given
+        self._accounting = max_bytes is not None or sizer is not None
+        self._nbytes = 0
+        # Size of each record when it was stored, in the same order as the records
+        self._sizes = deque()
+        super().__init__(maxlen=maxlen)
+        self.put_many(data)
+
+    def __reduce__(self) -> tuple:
+        # The records are restored together with the sizes they were stored with,
+        # rather than appended again, which copy and pickle do in different orders
+        return _rebuild_buffer, (self.__class__, self.maxlen), (self.__dict__, list(self))
+
+    def __setstate__(self, state: tuple) -> None:
+        attributes, records = state
+        self.__dict__.update(attributes)
+        deque.extend(self, records)
+
+    @property
+    def nbytes(self) -> int:
+        if self._accounting:
+            return self._nbytes
+        return sum(map(self.sizer, self))
+
+    def _check_size(self, size: int) -> None:
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise ValueError(
+                f"Record of {size} bytes is larger than max_bytes of {self.max_bytes}"
+            )
+
+    def _push(self, data: Any, left: bool = False, size: Optional[int] = None) -> list:
+        if not self._accounting:
+            # The native deque evicts by itself; only note which record it drops
+            evicted = []
+            if self and len(self) == self.maxlen:
+                evicted.append(self[-1] if left else self[0])
+            if left:
+                super().appendleft(data)
+            else:
+                super().append(data)
+            return evicted
+        if size is None:
+            size = self.sizer(data)
+            self._check_size(size)
+        evicted = []
+        # Evict from the opposite end to the one being added to, as deque does
+        while self and (
+            (self.maxlen is not None and len(self) >= self.maxlen)
+            or (self.max_bytes is not None and self._nbytes + size > self.max_bytes)
+        ):
+            evicted.append(self.pop() if left else self.popleft())
+        if left:
+            super().appendleft(data)
+            self._sizes.appendleft(size)
+        else:
+            super().append(data)
+            self._sizes.append(size)
+        self._nbytes += size
+        if evicted:
+            logger.debug(
+                f"{self.__class__.__name__} evicted {len(evicted)} records to stay within capacity"
+            )
+        return evicted
+
+    def _push_many(self, data: Iterable, left: bool = False) -> list:
+        if not self._accounting:
+            return self._extend_native(data, left)
+        records = list(data)
+        # Check every record before storing any, so a batch is stored whole or not at all
+        sizes = [self.sizer(record) for record in records]
+        for size in sizes:
+            self._check_size(size)
+        evicted = []
+        for record, size in zip(records, sizes):
+            evicted += self._push(record, left, size)
+        return evicted
+
+    def _extend_native(self, data: Iterable, left: bool = False) -> list:
+        if self.maxlen is None:
+            if left:
+                super().extendleft(data)
+            else:
+                super().extend(data)
+            return []
+        records = data if isinstance(data, list) else list(data)
+        overflow = len(self) + len(records) - self.maxlen
+        evicted = []
+        if overflow > 0:
+            # Records already stored are dropped first, then the earliest new ones
+            stored = min(overflow, len(self))
+            if left:
+                evicted = [self[-1 - i] for i in range(stored)]
+            else:
+                evicted = list(islice(self, stored))
+            evicted += records[: overflow - stored]
+        if left:
+            super().extendleft(records)
+        else:
+            super().extend(records)
+        return evicted
+
+    def append(self, data: Any) -> None:
+        if self._accounting:
+            self._push(data)
+        else:
+            deque.append(self, data)
+
+    def appendleft(self, data: Any) -> None:
+        if self._accounting:
+            self._push(data, left=True)
+        else:
+            super().appendleft(data)
 
-    def _append(self, data: Any, _append_func: Callable) -> None:
+    def extend(self, data: Iterable) -> None:
+        if self._accounting:
+            self._push_many(data)
+        else:
+            super().extend(data)
+
+    def extendleft(self, data: Iterable) -> None:
+        if self._accounting:
+            self._push_many(data, left=True)
+        else:
+            super().extendleft(data)
+
+    def __iadd__(self, data: Iterable) -> "Buffer":
+        self.extend(data)
+        return self
+
+    def insert(self, index: int, data: Any) -> None:
+        if not self._accounting:
+            return super().insert(index, data)
+        size = self.sizer(data)
+        self._check_size(self._nbytes + size)
+        super().insert(index, data)
+        self._sizes.insert(index, size)
+        self._nbytes += size
+
+    def __setitem__(self, index: int, data: Any) -> None:
+        if not self._accounting:
+            return super().__setitem__(index, data)
+        size = self.sizer(data)
+        difference = size - self._sizes[index]
+        self._check_size(self._nbytes + difference)
+        super().__setitem__(index, data)
+        self._sizes[index] = size
+        self._nbytes += difference
+
+    def pop(self) -> Any:
+        item = deque.pop(self)
+        if self._accounting:
+            # Subtract the size the record was stored with, in case it has changed
+            self._nbytes -= self._sizes.pop()
+        return item
+
+    def popleft(self) -> Any:
+        item = deque.popleft(self)
+        if self._accounting:
+            self._nbytes -= self._sizes.popleft()
+        return item
+
+    def remove(self, data: Any) -> None:
+        if not self._accounting:
+            return super().remove(data)
+        # Size the element that is removed, which may differ from an equal argument
+        del self[self.index(data)]
+
+    def __delitem__(self, index: int) -> None:
+        if not self._accounting:
+            return super().__delitem__(index)
+        super().__delitem__(index)
+        self._nbytes -= self._sizes[index]
+        del self._sizes[index]
+
+    def clear(self) -> None:
+        super().clear()
+        self._sizes.clear()
+        self._nbytes = 0
+
+    def rotate(self, n: int = 1) -> None:
+        super().rotate(n)
+        if self._accounting:
+            self._sizes.rotate(n)
+
+    def reverse(self) -> None:
+        super().reverse()
+        if self._accounting:
+            self._sizes.reverse()
+
+    def _records(self, data: Any) -> list:
+        if is_record(data):
+            # Dataclasses and NamedTuples are always a single record
+            return [data]
         if isinstance(data, (list, tuple, set)):
             try:
                 if isinstance(data[0], (int, float, str)):
                     # If data is a list of non-lists, add the list to the buffer
-                    _append_func(data)
+                    return [data]
                 else:
                     # Assume that the data is a list of objects that need to be stored individually
-                    for el in data:
-                        _append_func(el)
+                    return list(data)
             except (KeyError, ValueError):
-                _append_func(data)
+                return [data]
         else:
-            _append_func(data)
-
-    def put(self, data: Any) -> None:
-        self._append(data, self.append)
-
-    def putback(self, data: Any) -> None:
-        self._append(data, self.appendleft)
+            return [data]
+
+    def _append(self, data: Any, left: bool = False) -> list:
+        records = self._records(data)
+        if len(records) == 1:
+            return self._push(records[0], left)
+        return self._push_many(records, left)
+
+    def put(self, data: Any) -> list:
+        if self._accounting or isinstance(data, (list, tuple, set)):
+            return self._append(data)
+        # Fast path for a single record, leaving eviction to the native deque
+        if len(self) == self.maxlen and self.maxlen:
+            evicted = [self[0]]
+            deque.append(self, data)
+            return evicted
+        deque.append(self, data)
+        return []
+
+    def putback(self, data: Any) -> list:
+        return self._append(data, left=True)
+
+    def put_many(self, data: Iterable) -> list:
+        # Store each element as its own record, without inspecting its contents
+        return self._push_many(data)
 
     def get(self, index: Optional[int] = None) -> Any:
         if self.empty():
@@ -73,7 +309,7 @@ class Buffer(deque):
                 raise IndexError("Index is out of range") from e
         else:
             try:
-                return self.popleft()
+                return self.popleft() if self._accounting else deque.popleft(self)
             except IndexError:
                 return None
 
@@ -89,12 +325,36 @@ class Buffer(deque):
     def empty(self) -> bool:
         return self.size() == 0
 
+    def full(self) -> bool:
+        if self.max_bytes is not None and self._nbytes >= self.max_bytes:
+            return True
+        return self.maxlen is not None and self.size() >= self.maxlen
+
+    def record_size(self, data: Any) -> int:
+        # Size that a record would be stored with
+        return self.sizer(data)
+
+    def has_room(self, data: Any) -> bool:
+        # Whether data can be stored without evicting any records
+        if self.maxlen is not None and self.size() >= self.maxlen:
+            return False
+        if self.max_bytes is not None:
+            return self._nbytes + self.record_size(data) <= self.max_bytes
+        return True
+
+    def free(self) -> Optional[int]:
+        # Number of records that can be stored before the oldest are discarded
+        if self.maxlen is None:
+            return None
+        return max(self.maxlen - self.size(), 0)
+
     def dump(self, max: Optional[int] = None) -> list:
         max = max or self.size()
         if max == -1:
             return list(self)
         length = min(max, self.size())
-        return [self.popleft() for _ in range(length)]
+        popleft = self.popleft if self._accounting else super().popleft
+        return [popleft() for _ in range(length)]
 
     def peek(self, index: int = 0) -> Any:
         if self.empty():
@@ -119,24 +379,121 @@ class Buffer(deque):
         return self.__repr__()
 
 
+def _pack_chunk(packager: Packager, records: list) -> list:
+    # Module level so that it can be sent to a process pool
+    return [packager.pack(record) for record in records]
+
+
 class PackagedBuffer(Buffer):
+    """
+    A buffer that packs and unpacks its records with a packager
+
+    With pack_on_put, records are packed as they are put into the buffer and stored
+    as ready-to-send frames. dump_packed then returns the stored frames without
+    packing them again, and dump_unpacked unpacks them on the way out. putback
+    expects frames, such as those returned by a failed dump_packed.
+
+    With an executor, large dumps are split into chunks of records that are packed
+    in parallel and returned in order, still one frame per record. Dumps that would
+    pack quickly on the calling thread are not split. A separate put_executor does
+    the same for batches put into the buffer with pack_on_put.
+
+    Args:
+        data (list, tuple, set, dict, optional): Data to initialize the buffer with. Defaults to None.
+        packager (Packager, optional): The packager used to pack records. Defaults to JSONPackager().
+        maxlen (int, optional): The maximum length of the buffer. Defaults to 4096.
+        terminator (str, optional): The terminator of packed records. Defaults to "\\n".
+        max_bytes (int, optional): The maximum total packed size of the records in the buffer. Defaults to None.
+        sizer (Callable, optional): Returns the size of a record in bytes, or of a frame with pack_on_put.
+            Defaults to the packed size.
+        pack_on_put (bool, optional): Pack records when they are put into the buffer. Defaults to False.
+        executor (Executor, optional): Executor used to pack large dumps. Defaults to None.
+        put_executor (Executor, optional): Executor used to pack large puts with pack_on_put. Defaults to None.
+        parallel_threshold (float, optional): Estimated seconds of packing below which records are
+            packed on the calling thread. Defaults to 0.005.
+        parallel_chunksize (int, optional): Minimum number of records packed per executor task. Defaults to 1024.
+
+    """
+
     def __init__(
         self,
         data: Any = None,
         packager: Packager = None,
         maxlen: int = 4096,
         terminator: str = "\n",
+        max_bytes: Optional[int] = None,
+        sizer: Optional[Callable[[Any], int]] = None,
+        pack_on_put: bool = False,
+        executor: Optional[Executor] = None,
+        put_executor: Optional[Executor] = None,
+        parallel_threshold: float = 0.005,
+        parallel_chunksize: int = 1024,
     ) -> None:
         data = data or []
-        super().__init__(data, maxlen=maxlen)
         self.packager = packager or JSONPackager()
         self.terminator = terminator
+        self.pack_on_put = pack_on_put
+        self.executor = executor
+        self.put_executor = put_executor
+        self.parallel_threshold = parallel_threshold
+        self.parallel_chunksize = parallel_chunksize
+        # Budget records by their packed size unless told otherwise
+        if max_bytes is not None and sizer is None:
+            sizer = self._frame_size if pack_on_put else self._packed_size
+        super().__init__(data, maxlen=maxlen, max_bytes=max_bytes, sizer=sizer)
 
     def _pack(self, data, terminate: bool = True) -> str:
         if self.packager:
             return self.packager.pack(data, terminate)
         return data
 
+    def _pack_many(self, data: Iterable) -> list:
+        records = data if isinstance(data, list) else list(data)
+        if self.put_executor is not None:
+            return self._pack_parallel(self.put_executor, records)
+        return _pack_chunk(self.packager, records)
+
+    def _frame_size(self, frame: Union[str, bytes]) -> int:
+        return len(frame.encode() if isinstance(frame, str) else frame)
+
+    def _packed_size(self, data: Any) -> int:
+        return self._frame_size(self._pack(data))
+
+    def record_size(self, data: Any) -> int:
+        # With pack_on_put the sizer measures frames, so pack the record first
+        if self.pack_on_put:
+            data = self._pack(data)
+        return self.sizer(data)
+
+    def put(self, data: Any) -> list:
+        if self.pack_on_put:
+            return super().put_many(self._pack_many(self._records(data)))
+        return super().put(data)
+
+    def putback(self, data: Any) -> list:
+        if self.pack_on_put:
+            # Frames are put back in order, ahead of the rest of the buffer
+            frames = data if isinstance(data, list) else [data]
+            evicted = []
+            for frame in reversed(frames):
+                evicted += self._push(frame, left=True)
+            return evicted
+        return super().putback(data)
+
+    def put_many(self, data: Iterable) -> list:
+        if self.pack_on_put:
+            data = self._pack_many(data)
+        return super().put_many(data)
+
+    def copy(self) -> "PackagedBuffer":
+        # Executors are shared with the copy rather than copied
+        memo = {
+            id(executor): executor
+            for executor in (self.executor, self.put_executor)
+            if executor is not None
+        }
+        return deepcopy(self, memo)
+
     def _unpack(self, data: Any) -> Any:
         if self.packager:
             return self.packager.unpack(data)
@@ -144,6 +501,10 @@ class PackagedBuffer(Buffer):
 
     def next_packed(self, terminate: bool = True) -> str:
         next_data = self.get()
+        if self.pack_on_put:
+            if terminate or next_data is None:
+                return next_data
+            return next_data.removesuffix(self.packager.terminator)
         # pack the next data before returning it
         return self.packager.pack(next_data, terminate)
 
@@ -156,14 +517,135 @@ class PackagedBuffer(Buffer):
         dump_length = min(max, len(self))
         return [next_func() for _ in range(dump_length)]
 
-    def dump_packed(self, max: Optional[int] = None):
-        return self._dump_with_func(self.next_packed, max)
+    def dump_packed(
+        self,
+        max: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        chunksize: Optional[int] = None,
+    ):
+        if self.pack_on_put:
+            return self.dump(max)
+        executor = executor or self.executor
+        if executor is None:
+            return self._dump_with_func(self.next_packed, max)
+        return self._dump_parallel(executor, max, chunksize)
+
+    def dump_packed_batch(self, max: Optional[int] = None, terminate: bool = True):
+        # Pack the records together as one frame, for packagers that encode a batch
+        # better than its records one at a time
+        records = self.dump(max)
+        if not records:
+            return None
+        if self.pack_on_put:
+            # Frames packed on put are unpacked so the batch is packed as a whole
+            records = [self._unpack(frame) for frame in records]
+        return self.packager.pack(records, terminate)
+
+    def _dump_parallel(
+        self, executor: Executor, max: Optional[int], chunksize: Optional[int]
+    ) -> list:
+        records = self._dump_with_func(self.get, max)
+        try:
+            return self._pack_parallel(executor, records, chunksize)
+        except Exception:
+            # Return the records to the buffer so that none are lost
+            super().extendleft(reversed(records))
+            raise
+
+    def _chunksize(self, count: int) -> int:
+        # Around four chunks per CPU, but no smaller than parallel_chunksize
+        return max(self.parallel_chunksize, math.ceil(count / (os.cpu_count() or 1) / 4))
+
+    def _pack_parallel(
+        self, executor: Executor, records: list, chunksize: Optional[int] = None
+    ) -> list:
+        chunksize = chunksize or self._chunksize(len(records))
+        chunks = [
+            records[i : i + chunksize] for i in range(0, len(records), chunksize)
+        ]
+        # Pack the first chunk here, and only hand the rest to the executor if
+        # packing them here would take longer than parallel_threshold seconds
+        start = time.perf_counter()
+        packed = _pack_chunk(self.packager, chunks[0]) if chunks else []
+        estimate = (time.perf_counter() - start) * (len(chunks) - 1)
+        if estimate < self.parallel_threshold:
+            for chunk in chunks[1:]:
+                packed += _pack_chunk(self.packager, chunk)
+        else:
+            for frames in executor.map(_pack_chunk, repeat(self.packager), chunks[1:]):
+                packed += frames
+        return packed
 
     def dump_unpacked(self, max: Optional[int] = None):
-        if isinstance(self.peek(index=0), list):
+        if isinstance(self.peek(index=0), list) or is_record(self.peek(index=0)):
             return self.dump(max)
         return self._dump_with_func(self.next_unpacked, max)
 
+    def _iter_with_func(self, next_func: Callable, max: Optional[int] = None) -> Iterator:
+        # Records are only taken from the buffer as the caller asks for them. As with
+        # dump, a max of None or 0 takes every record
+        count = 0
+        while self and (not max or count < max):
+            yield next_func()
+            count += 1
+
+    def iter_packed(self, max: Optional[int] = None) -> Iterator:
+        return self._iter_with_func(self.next_packed, max)
+
+    def iter_unpacked(self, max: Optional[int] = None) -> Iterator:
+        if isinstance(self.peek(index=0), list) or is_record(self.peek(index=0)):
+            return self._iter_with_func(self.get, max)
+        return self._iter_with_func(self.next_unpacked, max)
+
+    def reader(
+        self, max: Optional[int] = None, encoding: str = "utf-8"
+    ) -> "PackagedBufferReader":
+        return PackagedBufferReader(self, max=max, encoding=encoding)
+
+
+class PackagedBufferReader(io.RawIOBase):
+    """
+    A file-like reader that drains packed records from a PackagedBuffer
+
+    Records are taken from the buffer and packed only as the caller reads, so the
+    reader can be passed to shutil.copyfileobj or a socket sender in constant memory.
+
+    Args:
+        buffer (PackagedBuffer): The buffer to read packed records from.
+        max (int, optional): The maximum number of records to read. Defaults to None.
+        encoding (str, optional): Encoding of frames from text packagers. Defaults to "utf-8".
+
+    """
+
+    def __init__(
+        self, buffer: PackagedBuffer, max: Optional[int] = None, encoding: str = "utf-8"
+    ) -> None:
+        super().__init__()
+        self.buffer = buffer
+        self.encoding = encoding
+        self._frames = buffer.iter_packed(max)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        view = memoryview(b).cast("B")
+        written = 0
+        while written < len(view):
+            if not self._pending:
+                frame = next(self._frames, None)
+                if frame is None:
+                    break
+                if isinstance(frame, str):
+                    frame = frame.encode(self.encoding)
+                self._pending = memoryview(frame)
+            length = min(len(self._pending), len(view) - written)
+            view[written : written + length] = self._pending[:length]
+            self._pending = self._pending[length:]
+            written += length
+        return written
+
 
 # TODO Implement this
 # class PacketOptimizedBuffer(PackagedBuffer):
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+"""
+Capture and replay of packed frames.
+
+The CaptureWriter class appends packed frames, with the time they were written,
+to a capture file and a sidecar index of fixed size entries. The CaptureReader
+class memory maps both for random access by sequence number or time, and can
+replay the frames into a buffer or sender at their original pace or faster.
+
+"""
+# ---------------------------------------------------------------------------
+
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from buffered.buffer import Buffer, PackagedBuffer
+
+logger = logging.getLogger(__name__)
+
+# Each frame in the capture file is preceded by its timestamp, length and flags
+HEADER = struct.Struct("<dIB")
+# Each index entry holds the offset of a frame, its timestamp, length and flags
+INDEX_ENTRY = struct.Struct("<QdIB")
+TEXT = 1
+
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+class CaptureWriter:
+    """
+    Appends packed frames to a capture file and its index
+
+    Args:
+        path (str): Path of the capture file. The index is written alongside it.
+        encoding (str, optional): Encoding used to store str frames. Defaults to "utf-8".
+        clock (Callable, optional): Returns the timestamp of each frame. Defaults to time.time.
+
+    """
+
+    def __init__(
+        self,
+        path: str,
+        encoding: str = "utf-8",
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.encoding = encoding
+        self.clock = clock
+        self._data = open(path, "ab")
+        self._index = open(index_path(path), "ab")
+        self._offset = self._data.tell()
+        self.count = self._index.tell() // INDEX_ENTRY.size
+
+    def write(self, frame: Union[str, bytes], timestamp: Optional[float] = None) -> int:
+        timestamp = self.clock() if timestamp is None else timestamp
+        flags = 0
+        if isinstance(frame, str):
+            frame = frame.encode(self.encoding)
+            flags |= TEXT
+        self._data.write(HEADER.pack(timestamp, len(frame), flags))
+        self._data.write(frame)
+        self._offset += HEADER.size
+        self._index.write(INDEX_ENTRY.pack(self._offset, timestamp, len(frame), flags))
+        self._offset += len(frame)
+        seq = self.count
+        self.count += 1
+        return seq
+
+    def write_many(
+        self, frames: Iterable[Union[str, bytes]], timestamp: Optional[float] = None
+    ) -> None:
+        # Frames emitted together, such as a dump_packed, share a timestamp
+        timestamp = self.clock() if timestamp is None else timestamp
+        for frame in frames:
+            self.write(frame, timestamp)
+
+    def flush(self) -> None:
+        self._data.flush()
+        self._index.flush()
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def _map(file) -> Union[mmap.mmap, bytes]:
+    # Empty files cannot be memory mapped
+    if os.fstat(file.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CaptureReader:
+    """
+    Reads frames from a capture file written by CaptureWriter
+
+    Args:
+        path (str): Path of the capture file.
+        encoding (str, optional): Encoding used to decode str frames. Defaults to "utf-8".
+
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8") -> None:
+        self.path = path
+        self.encoding = encoding
+        self._data_file = open(path, "rb")
+        self._index_file = open(index_path(path), "rb")
+        self._data = _map(self._data_file)
+        self._index = _map(self._index_file)
+        self.count = len(self._index) // INDEX_ENTRY.size
+
+    def _entry(self, seq: int) -> Tuple[int, float, int, int]:
+        if seq < 0:
+            seq += self.count
+        if not 0 <= seq < self.count:
+            raise IndexError(f"Frame {seq} is out of range for capture of length {self.count}")
+        return INDEX_ENTRY.unpack_from(self._index, seq * INDEX_ENTRY.size)
+
+    def __getitem__(self, seq: int) -> Union[str, bytes]:
+        offset, _, length, flags = self._entry(seq)
+        frame = self._data[offset : offset + length]
+        if flags & TEXT:
+            return frame.decode(self.encoding)
+        return frame
+
+    def __len__(self) -> int:
+        return self.count
+
+    def timestamp(self, seq: int) -> float:
+        return self._entry(seq)[1]
+
+    def seq_at(self, timestamp: float) -> int:
+        # Sequence number of the first frame written at or after timestamp, found by
+        # bisecting the mapped index rather than loading every timestamp
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(self._index, middle * INDEX_ENTRY.size)[1] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def frames(
+        self, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[Tuple[float, Union[str, bytes]]]:
+        stop = self.count if stop is None else min(stop, self.count)
+        for seq in range(start, stop):
+            yield self.timestamp(seq), self[seq]
+
+    def between(
+        self, start_time: float, end_time: float
+    ) -> Iterator[Tuple[float, Union[str, bytes]]]:
+        return self.frames(self.seq_at(start_time), self.seq_at(end_time))
+
+    def replay(
+        self,
+        target: Union[Buffer, Callable[[Any], Any]],
+        speed: Optional[float] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> int:
+        """
+        Replay frames into a buffer or sender
+
+        Frames are passed to a callable, such as a socket's send method, or appended
+        to a buffer exactly as they were captured. A PackagedBuffer is given frames
+        as they were captured only with pack_on_put; otherwise each frame is unpacked
+        with the buffer's packager first, so that dump_packed does not pack it twice.
+
+        Args:
+            target (Buffer, Callable): The buffer or callable to send frames to.
+            speed (float, optional): Multiple of the original pace to replay at. Defaults to None, as fast as possible.
+            start (int, optional): Sequence number of the first frame to replay. Defaults to 0.
+            stop (int, optional): Sequence number to stop replaying before. Defaults to None.
+
+        """
+        if isinstance(target, PackagedBuffer) and not target.pack_on_put:
+
+            def send(frame):
+                target.append(target._unpack(frame))
+
+        elif isinstance(target, Buffer):
+            send = target.append
+        else:
+            send = target
+        replayed = 0
+        first = None
+        started = clock()
+        for timestamp, frame in self.frames(start, stop):
+            if speed:
+                first = timestamp if first is None else first
+                delay = started + (timestamp - first) / speed - clock()
+                if delay > 0:
+                    sleep(delay)
+            send(frame)
+            replayed += 1
+        return replayed
+
+    def close(self) -> None:
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -7,13 +7,176 @@
 # ---------------------------------------------------------------------------
 
 from abc import ABC, abstractmethod
+from dataclasses import fields, is_dataclass
+from functools import lru_cache
+from operator import attrgetter
 import pickle
+import struct
 import json
+import math
+from typing import get_origin, get_type_hints
+
+
+def is_record(data):
+    # Dataclass instances and NamedTuples are packed as tuples of their field values
+    return (is_dataclass(data) and not isinstance(data, type)) or (
+        isinstance(data, tuple) and hasattr(data, "_fields")
+    )
+
+
+def _is_record_type(cls):
+    return isinstance(cls, type) and (
+        is_dataclass(cls) or (issubclass(cls, tuple) and hasattr(cls, "_fields"))
+    )
+
+
+def _text_converter(cls):
+    # Converts a field read back from a text format to its annotated type
+    if cls is bool:
+        return lambda value: value in ("True", "true", "1")
+    if cls in (int, float, str):
+        return cls
+    return lambda value: value
+
+
+def _record_fields(record_type):
+    # Names of the fields passed to the constructor, in the order it takes them
+    if is_dataclass(record_type):
+        return tuple(field.name for field in fields(record_type) if field.init)
+    return tuple(record_type._fields)
+
+
+def _record_getter(record_type, names):
+    # Returns the field values of a record as a tuple
+    if not is_dataclass(record_type):
+        return tuple
+    if len(names) == 1:
+        getter = attrgetter(names[0])
+
+        def get(record):
+            return (getter(record),)
+
+        return get
+    if names:
+        return attrgetter(*names)
+
+    def get(record):
+        return ()
+
+    return get
+
+
+def _record_converters(record_type, get, nested):
+    # Builds the encode and decode functions, going through the codecs of nested
+    # records only if there are any
+    if not any(nested):
+
+        def decode(values):
+            return record_type(*values)
+
+        return get, decode
+
+    def encode(record):
+        return tuple(
+            codec.encode(value) if codec and value is not None else value
+            for codec, value in zip(nested, get(record))
+        )
+
+    def decode(values):
+        return record_type(
+            *(
+                codec.decode(value) if codec and value is not None else value
+                for codec, value in zip(nested, values)
+            )
+        )
+
+    return encode, decode
+
+
+class RecordCodec:
+    """
+    Converts dataclass and NamedTuple records to and from tuples of their field values
+
+    The encoder and decoders are built once per record type, with the field order
+    fixed by the type's definition. Fields that are themselves dataclasses or
+    NamedTuples are encoded and decoded with their own codec.
+
+    Args:
+        record_type (type): The dataclass or NamedTuple type to convert.
+
+    """
+
+    def __init__(self, record_type):
+        if not _is_record_type(record_type):
+            raise TypeError(f"{record_type!r} is not a dataclass or NamedTuple type")
+        self.record_type = record_type
+        self.fields = _record_fields(record_type)
+        try:
+            hints = get_type_hints(record_type)
+        except Exception:
+            hints = {}
+        types = [hints.get(name) for name in self.fields]
+        nested = [record_codec(cls) if _is_record_type(cls) else None for cls in types]
+        converters = [_text_converter(cls) for cls in types]
+        # A batch of records is told apart from a single record by its first
+        # element, which needs a closer look if a record can start with a sequence
+        first = types[0] if types else None
+        self._first_codec = nested[0] if nested else None
+        self._first_is_sequence = (
+            _is_record_type(first)
+            or first in (list, tuple)
+            or get_origin(first) in (list, tuple)
+        )
+        get = _record_getter(record_type, self.fields)
+        self.encode, self.decode = _record_converters(record_type, get, nested)
+
+        def decode_text(values):
+            return record_type(
+                *(convert(value) for convert, value in zip(converters, values))
+            )
+
+        self.decode_text = decode_text
+
+    def _is_encoded(self, data):
+        if not isinstance(data, (list, tuple)) or len(data) != len(self.fields):
+            return False
+        if not data or not self._first_is_sequence:
+            return True
+        if self._first_codec is not None:
+            return self._first_codec._is_encoded(data[0])
+        return isinstance(data[0], (list, tuple))
+
+    def is_batch(self, data):
+        if not isinstance(data, (list, tuple)) or not data:
+            return False
+        if self._first_is_sequence:
+            return self._is_encoded(data[0])
+        return isinstance(data[0], (list, tuple))
+
+
+@lru_cache(maxsize=256)
+def record_codec(record_type):
+    # The cache keeps a reference to each record type it has seen, so a type defined
+    # inside a function is not freed until 256 other types have been cached since
+    return RecordCodec(record_type)
 
 
 class Packager(ABC):
-    def __init__(self, terminator="\n"):
+    """
+    Base class for packagers
+
+    Dataclass and NamedTuple records are packed as their field values. Given a
+    record_type, unpack returns records of that type.
+
+    Args:
+        terminator (str, bytes, optional): Appended to packed data. Defaults to "\\n".
+        record_type (type, optional): The dataclass or NamedTuple type of unpacked records. Defaults to None.
+
+    """
+
+    def __init__(self, terminator="\n", record_type=None):
         self.terminator = terminator
+        self.record_type = record_type
 
     @abstractmethod
     def pack(self, data, terminate=True): ...
@@ -21,11 +184,27 @@ class Packager(ABC):
     @abstractmethod
     def unpack(self, data): ...
 
+    def _encode_records(self, data):
+        if is_record(data):
+            return record_codec(type(data)).encode(data)
+        if isinstance(data, list) and data and is_record(data[0]):
+            return [record_codec(type(record)).encode(record) for record in data]
+        return data
+
+    def _decode_records(self, data, text=False):
+        if self.record_type is None or data is None:
+            return data
+        codec = record_codec(self.record_type)
+        decode = codec.decode_text if text else codec.decode
+        if codec.is_batch(data):
+            return [decode(values) for values in data]
+        return decode(data)
+
 
 class SeparatorPackager(Packager):
-    def __init__(self, sep_major="|", sep_minor=";", terminator="\n"):
+    def __init__(self, sep_major="|", sep_minor=";", terminator="\n", record_type=None):
         """ """
-        super().__init__(terminator)
+        super().__init__(terminator, record_type)
         # Set the major and minor separators
         self.sep_major = sep_major
         self.sep_minor = sep_minor
@@ -33,6 +212,7 @@ class SeparatorPackager(Packager):
     def pack(self, data, terminate=True):
         # Pack some data into a separated string
         packed_data = ""
+        data = self._encode_records(data)
         if not isinstance(data[0], (list, tuple)):
             data = [data]
         for item in data:
@@ -53,23 +233,341 @@ class SeparatorPackager(Packager):
             unpacked.append(values)
         if len(unpacked) == 1:
             unpacked = unpacked[0]
-        return unpacked
+        return self._decode_records(unpacked, text=True)
 
 
 class PicklerPackager(Packager):
     def pack(self, data, terminate=True):
+        # Pickle keeps the type of records itself, so only strip it if the type is known
+        if self.record_type is not None:
+            data = self._encode_records(data)
         return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL) + (
             self.terminator if terminate else b""
         )
 
     def unpack(self, data):
-        return pickle.loads(data)
+        return self._decode_records(pickle.loads(data))
 
 
 class JSONPackager(Packager):
     def pack(self, data, terminate=True):
-        return json.dumps(data) + (self.terminator if terminate else "")
+        return json.dumps(self._encode_records(data)) + (self.terminator if terminate else "")
 
     def unpack(self, data):
         if data := data.removesuffix(self.terminator):
-            return json.loads(data)
+            return self._decode_records(json.loads(data))
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class _BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self._bits = 0
+        self._nbits = 0
+
+    def write(self, value, nbits):
+        self._bits = (self._bits << nbits) | value
+        self._nbits += nbits
+        while self._nbits >= 8:
+            self._nbits -= 8
+            self.data.append((self._bits >> self._nbits) & 0xFF)
+        self._bits &= (1 << self._nbits) - 1
+
+    def getvalue(self):
+        if self._nbits:
+            return bytes(self.data) + bytes([(self._bits << (8 - self._nbits)) & 0xFF])
+        return bytes(self.data)
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, nbits):
+        start = self.pos >> 3
+        end = (self.pos + nbits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], "big")
+        self.pos += nbits
+        return (chunk >> (end * 8 - self.pos)) & ((1 << nbits) - 1)
+
+
+def _encode_xor(values):
+    # Gorilla float compression: each value is stored as the meaningful bits of
+    # its XOR with the previous value, reusing the previous window when it fits
+    words = struct.unpack(f">{len(values)}Q", struct.pack(f">{len(values)}d", *values))
+    bits = _BitWriter()
+    previous = words[0]
+    bits.write(previous, 64)
+    window_leading = -1
+    window_trailing = 0
+    for word in words[1:]:
+        xor = word ^ previous
+        previous = word
+        if not xor:
+            bits.write(0, 1)
+            continue
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if window_leading >= 0 and leading >= window_leading and trailing >= window_trailing:
+            bits.write(0b10, 2)
+            bits.write(xor >> window_trailing, 64 - window_leading - window_trailing)
+        else:
+            meaningful = 64 - leading - trailing
+            bits.write(0b11, 2)
+            bits.write(leading, 5)
+            bits.write(meaningful - 1, 6)
+            bits.write(xor >> trailing, meaningful)
+            window_leading = leading
+            window_trailing = trailing
+    return bits.getvalue()
+
+
+def _decode_xor(data, count):
+    bits = _BitReader(data)
+    word = bits.read(64)
+    words = [word]
+    window_leading = 0
+    window_trailing = 0
+    for _ in range(count - 1):
+        if bits.read(1):
+            if bits.read(1):
+                window_leading = bits.read(5)
+                meaningful = bits.read(6) + 1
+                window_trailing = 64 - window_leading - meaningful
+            word ^= bits.read(64 - window_leading - window_trailing) << window_trailing
+        words.append(word)
+    return list(struct.unpack(f">{count}d", struct.pack(f">{count}Q", *words)))
+
+
+def _encode_delta_of_delta(values):
+    out = bytearray()
+    _write_varint(out, _zigzag(values[0]))
+    previous = values[0]
+    previous_delta = 0
+    for value in values[1:]:
+        delta = value - previous
+        _write_varint(out, _zigzag(delta - previous_delta))
+        previous = value
+        previous_delta = delta
+    return bytes(out)
+
+
+def _decode_delta_of_delta(data, count):
+    value, pos = _read_varint(data, 0)
+    values = [_unzigzag(value)]
+    delta = 0
+    for _ in range(count - 1):
+        dod, pos = _read_varint(data, pos)
+        delta += _unzigzag(dod)
+        value = values[-1] + delta
+        values.append(value)
+    return values
+
+
+class TimeSeriesPackager(Packager):
+    """
+    Packs (name, value, timestamp) samples into a compact binary frame
+
+    Samples are grouped by series name. Timestamps are stored as delta-of-delta
+    varints, and float values with Gorilla XOR compression, so regularly spaced
+    timestamps and slowly changing values take a bit or a byte per sample. The
+    original order of the samples is kept, and unpacking is lossless.
+
+    Columns of ints, bools, and float timestamps with whole values are stored as
+    integers. Other float columns are XOR compressed. Columns that mix ints, bools
+    and floats are XOR compressed as floats with a run-length encoded type tag for
+    each sample, so every value comes back with its original type. Ints in mixed
+    columns must be exactly representable as floats, below 2**53 in magnitude.
+    Only int, float and bool timestamps and values are supported; instances of
+    their subclasses come back as the base type.
+
+    Args:
+        terminator (bytes, optional): Appended to packed data. Defaults to b"".
+        record_type (type, optional): The dataclass or NamedTuple type of unpacked records. Defaults to None.
+
+    """
+
+    _FLOAT = 0
+    _INT = 1
+    _WHOLE_FLOAT = 2
+    _BOOL = 3
+    _MIXED = 4
+    _SINGLE = 1
+
+    def __init__(self, terminator=b"", record_type=None):
+        super().__init__(terminator, record_type)
+
+    @classmethod
+    def _tag(cls, value):
+        # Bool is checked first as it is a subclass of int
+        if isinstance(value, bool):
+            return cls._BOOL
+        if isinstance(value, int):
+            return cls._INT
+        if isinstance(value, float):
+            return cls._FLOAT
+        raise TypeError(f"Cannot pack {type(value).__name__} value {value!r}, only int, float and bool")
+
+    @classmethod
+    def _kind(cls, values, whole_floats):
+        tags = {cls._tag(value) for value in values}
+        if len(tags) > 1:
+            return cls._MIXED
+        kind = tags.pop()
+        if (
+            kind == cls._FLOAT
+            and whole_floats
+            and all(
+                value.is_integer() and abs(value) < 2**53 and math.copysign(1.0, value) > 0
+                for value in values
+            )
+        ):
+            # Whole float timestamps are stored as ints; -0.0 is not, to keep its sign
+            return cls._WHOLE_FLOAT
+        return kind
+
+    @classmethod
+    def _encode_column(cls, values, kind):
+        if kind == cls._FLOAT:
+            return _encode_xor([float(value) for value in values])
+        if kind == cls._MIXED:
+            out = bytearray()
+            runs = []
+            for value in values:
+                tag = cls._tag(value)
+                if tag == cls._INT and abs(value) >= 2**53:
+                    raise ValueError(f"Int {value} in a mixed column cannot be stored exactly as a float")
+                if runs and runs[-1][0] == tag:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([tag, 1])
+            _write_varint(out, len(runs))
+            for tag, length in runs:
+                _write_varint(out, tag)
+                _write_varint(out, length)
+            return bytes(out) + _encode_xor([float(value) for value in values])
+        if kind != cls._INT:
+            values = [int(value) for value in values]
+        return _encode_delta_of_delta(values)
+
+    @classmethod
+    def _decode_column(cls, data, kind, count):
+        if kind == cls._FLOAT:
+            return _decode_xor(data, count)
+        if kind == cls._MIXED:
+            nruns, pos = _read_varint(data, 0)
+            tags = []
+            for _ in range(nruns):
+                tag, pos = _read_varint(data, pos)
+                length, pos = _read_varint(data, pos)
+                tags += [tag] * length
+            convert = {cls._FLOAT: float, cls._INT: int, cls._BOOL: bool}
+            return [
+                convert[tag](value)
+                for tag, value in zip(tags, _decode_xor(data[pos:], count))
+            ]
+        values = _decode_delta_of_delta(data, count)
+        if kind == cls._WHOLE_FLOAT:
+            return [float(value) for value in values]
+        if kind == cls._BOOL:
+            return [bool(value) for value in values]
+        return values
+
+    def pack(self, data, terminate=True):
+        data = self._encode_records(data)
+        single = not isinstance(data[0], (list, tuple))
+        if single:
+            data = [data]
+        series = {}
+        indices = {}
+        # Runs of consecutive samples from the same series, to restore the order
+        runs = []
+        for name, value, timestamp in data:
+            samples = series.setdefault(name, ([], []))
+            samples[0].append(value)
+            samples[1].append(timestamp)
+            index = indices.setdefault(name, len(indices))
+            if runs and runs[-1][0] == index:
+                runs[-1][1] += 1
+            else:
+                runs.append([index, 1])
+
+        out = bytearray([self._SINGLE if single else 0])
+        _write_varint(out, len(series))
+        for name, (values, timestamps) in series.items():
+            encoded_name = name.encode()
+            _write_varint(out, len(encoded_name))
+            out += encoded_name
+            _write_varint(out, len(values))
+            time_kind = self._kind(timestamps, whole_floats=True)
+            value_kind = self._kind(values, whole_floats=False)
+            out.append(time_kind << 4 | value_kind)
+            for column in (
+                self._encode_column(timestamps, time_kind),
+                self._encode_column(values, value_kind),
+            ):
+                _write_varint(out, len(column))
+                out += column
+        _write_varint(out, len(runs))
+        for index, length in runs:
+            _write_varint(out, index)
+            _write_varint(out, length)
+        return bytes(out) + (self.terminator if terminate else b"")
+
+    def unpack(self, data):
+        single = data[0] & self._SINGLE
+        nseries, pos = _read_varint(data, 1)
+        columns = []
+        for _ in range(nseries):
+            length, pos = _read_varint(data, pos)
+            name = bytes(data[pos : pos + length]).decode()
+            pos += length
+            count, pos = _read_varint(data, pos)
+            kinds = data[pos]
+            pos += 1
+            length, pos = _read_varint(data, pos)
+            timestamps = self._decode_column(data[pos : pos + length], kinds >> 4, count)
+            pos += length
+            length, pos = _read_varint(data, pos)
+            values = self._decode_column(data[pos : pos + length], kinds & 0x0F, count)
+            pos += length
+            columns.append((name, iter(zip(values, timestamps))))
+        nruns, pos = _read_varint(data, pos)
+        unpacked = []
+        for _ in range(nruns):
+            index, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+            name, samples = columns[index]
+            for _ in range(length):
+                value, timestamp = next(samples)
+                unpacked.append((name, value, timestamp))
+        if single:
+            unpacked = unpacked[0]
+        return self._decode_records(unpacked)
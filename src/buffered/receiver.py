@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+"""
+Receiving side of the Buffered package.
+
+The PackagedReceiverProtocol class reads a stream of packed records from an
+asyncio transport, splits it on the packager's terminator, unpacks each frame
+and stores the decoded records in a buffer. Only text packagers can be received,
+as the frames of binary packagers may contain their own terminator.
+
+"""
+# ---------------------------------------------------------------------------
+
+import asyncio
+from collections import deque
+import logging
+from typing import Any, Optional
+
+from buffered.buffer import Buffer
+from buffered.packager import Packager
+
+logger = logging.getLogger(__name__)
+
+
+class PackagedReceiverProtocol(asyncio.BufferedProtocol):
+    """
+    An asyncio protocol that decodes a stream of packed records into a buffer
+
+    Reading is paused while the target buffer is full, and resumed once the
+    consumer has made room for the records that are still waiting. The packager
+    must pack str frames ended by a non-empty terminator.
+
+    Args:
+        packager (Packager): The packager used to unpack each received frame.
+        buffer (Buffer): The buffer to store decoded records in.
+        read_size (int, optional): Size of the preallocated read buffer. Defaults to 65536.
+        encoding (str, optional): Encoding of the received frames. Defaults to "utf-8".
+        resume_interval (float, optional): Seconds between checks for free space while paused. Defaults to 0.01.
+
+    """
+
+    def __init__(
+        self,
+        packager: Packager,
+        buffer: Buffer,
+        read_size: int = 65536,
+        encoding: str = "utf-8",
+        resume_interval: float = 0.01,
+    ) -> None:
+        self.packager = packager
+        self.buffer = buffer
+        self.encoding = encoding
+        self.resume_interval = resume_interval
+        terminator = packager.terminator
+        if not isinstance(terminator, str):
+            # Binary frames such as pickles may contain the terminator themselves
+            raise ValueError(
+                f"{self.__class__.__name__} can only split text frames, not {packager.__class__.__name__} frames"
+            )
+        if not terminator:
+            raise ValueError(f"{self.__class__.__name__} needs a packager with a non-empty terminator")
+        self._terminator = terminator.encode(encoding)
+        self._read_buffer = bytearray(read_size)
+        self._read_view = memoryview(self._read_buffer)
+        self._stream = bytearray()
+        # Offset in the stream to resume looking for a terminator from
+        self._searched = 0
+        self._pending = deque()
+        self._paused = False
+        self._resume_handle: Optional[asyncio.TimerHandle] = None
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._read_view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._stream += self._read_view[:nbytes]
+        records = []
+        start = 0
+        len_terminator = len(self._terminator)
+        while (end := self._stream.find(self._terminator, max(start, self._searched))) != -1:
+            if end > start:
+                record = self._decode(self._stream[start:end])
+                if record is not None and self._fits(record):
+                    records.append(record)
+            start = end + len_terminator
+        # Keep any partial frame until the rest of it arrives, without searching
+        # it again, other than for a terminator split across reads
+        del self._stream[:start]
+        self._searched = max(len(self._stream) - len_terminator + 1, 0)
+        if records:
+            self._pending.extend(records)
+            self._flush()
+
+    def eof_received(self) -> Optional[bool]:
+        if self._stream:
+            logger.warning(
+                f"{self.__class__.__name__} discarding {len(self._stream)} bytes of unterminated data"
+            )
+            self._stream.clear()
+            self._searched = 0
+        return None
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.transport = None
+        # Stop waiting for room once the peer is gone
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+            self._resume_handle = None
+        if self._pending:
+            logger.warning(
+                f"{self.__class__.__name__} discarding {len(self._pending)} records waiting for room after connection lost"
+            )
+            self._pending.clear()
+
+    def _decode(self, frame: bytearray) -> Any:
+        try:
+            return self.packager.unpack(frame.decode(self.encoding))
+        except Exception as e:
+            logger.error(f"{self.__class__.__name__} failed to unpack frame. {e}")
+            return None
+
+    def _fits(self, record: Any) -> bool:
+        # A record larger than the buffer's byte budget would never be stored
+        max_bytes = self.buffer.max_bytes
+        if max_bytes is None:
+            return True
+        size = self.buffer.record_size(record)
+        if size > max_bytes:
+            logger.error(
+                f"{self.__class__.__name__} discarding record of {size} bytes, larger than max_bytes of {max_bytes}"
+            )
+            return False
+        return True
+
+    def _flush(self) -> None:
+        self._resume_handle = None
+        if self.buffer.max_bytes is None:
+            free = self.buffer.free()
+            count = len(self._pending) if free is None else min(free, len(self._pending))
+            if count:
+                self.buffer.put_many([self._pending.popleft() for _ in range(count)])
+        else:
+            # Free space is measured in bytes, so check records one at a time
+            while self._pending and self.buffer.has_room(self._pending[0]):
+                self.buffer.put_many((self._pending.popleft(),))
+        if self._pending:
+            self._pause()
+        elif self._paused:
+            self._resume()
+
+    def _pause(self) -> None:
+        if not self._paused and self.transport is not None:
+            self.transport.pause_reading()
+        self._paused = True
+        if self._resume_handle is None:
+            loop = asyncio.get_running_loop()
+            self._resume_handle = loop.call_later(self.resume_interval, self._flush)
+
+    def _resume(self) -> None:
+        self._paused = False
+        if self.transport is not None:
+            self.transport.resume_reading()
+
+    def pending(self) -> int:
+        # Number of decoded records waiting for space in the buffer
+        return len(self._pending)
+
+
+async def start_receiver(
+    packager: Packager,
+    buffer: Buffer,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    read_size: int = 65536,
+    encoding: str = "utf-8",
+    resume_interval: float = 0.01,
+    **kwargs,
+) -> asyncio.AbstractServer:
+    """
+    Start a server that receives packed records into a buffer
+
+    Args:
+        packager (Packager): The packager used to unpack each received frame.
+        buffer (Buffer): The buffer to store decoded records in.
+        host (str, optional): The host to listen on. Defaults to None.
+        port (int, optional): The port to listen on. Defaults to None.
+        read_size (int, optional): Size of the preallocated read buffer. Defaults to 65536.
+        encoding (str, optional): Encoding of the received frames. Defaults to "utf-8".
+        resume_interval (float, optional): Seconds between checks for free space while paused. Defaults to 0.01.
+        **kwargs: Additional keyword arguments passed to loop.create_server.
+
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(
+        lambda: PackagedReceiverProtocol(
+            packager,
+            buffer,
+            read_size=read_size,
+            encoding=encoding,
+            resume_interval=resume_interval,
+        ),
+        host,
+        port,
+        **kwargs,
+    )
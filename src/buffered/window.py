@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+"""
+Acknowledged delivery for the Buffered package.
+
+The DeliveryWindow class takes packed frames from a PackagedBuffer, numbers them,
+and keeps them in a bounded in-flight window until they are acknowledged, so that
+several batches can be in flight at once and lost frames can be sent again
+without packing them again.
+
+"""
+# ---------------------------------------------------------------------------
+
+from collections import OrderedDict
+import logging
+import time
+from typing import Callable, Optional, Union
+
+from buffered.buffer import PackagedBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryWindow:
+    """
+    A sliding window of frames sent from a PackagedBuffer and awaiting acknowledgement
+
+    Frames that are given up on after max_attempts are removed from the window, and
+    their sequence numbers added to abandoned, so that the caller can account for
+    the lost data. The caller may clear abandoned once it has done so.
+
+    Args:
+        buffer (PackagedBuffer): The buffer to take packed frames from.
+        window (int, optional): The maximum number of unacknowledged frames. Defaults to 64.
+        timeout (float, optional): Seconds before an unacknowledged frame is sent again. Defaults to 1.0.
+        max_attempts (int, optional): Times a frame is sent before it is given up on. Defaults to None, no limit.
+        clock (Callable, optional): Returns the current time in seconds. Defaults to time.monotonic.
+
+    """
+
+    def __init__(
+        self,
+        buffer: PackagedBuffer,
+        window: int = 64,
+        timeout: float = 1.0,
+        max_attempts: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.buffer = buffer
+        self.window = window
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.next_seq = 0
+        self.abandoned = []
+        # seq -> [frame, time last sent, number of times sent], in order of seq
+        self._in_flight = OrderedDict()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def space(self) -> int:
+        return max(self.window - len(self._in_flight), 0)
+
+    def next_frames(self) -> list:
+        # Take as many new frames from the buffer as the window has room for
+        space = self.space()
+        if not space or self.buffer.empty():
+            return []
+        now = self.clock()
+        frames = []
+        for frame in self.buffer.dump_packed(space):
+            self._in_flight[self.next_seq] = [frame, now, 1]
+            frames.append((self.next_seq, frame))
+            self.next_seq += 1
+        return frames
+
+    def expired(self) -> list:
+        # Frames that have not been acknowledged in time, to be sent again
+        now = self.clock()
+        frames = []
+        for seq, entry in list(self._in_flight.items()):
+            frame, sent, attempts = entry
+            if now - sent < self.timeout:
+                continue
+            if self.max_attempts is not None and attempts >= self.max_attempts:
+                logger.warning(
+                    f"{self.__class__.__name__} giving up on frame {seq} after {attempts} attempts"
+                )
+                del self._in_flight[seq]
+                self.abandoned.append(seq)
+                continue
+            entry[1] = now
+            entry[2] += 1
+            frames.append((seq, frame))
+        return frames
+
+    def pending(self) -> list:
+        # Expired frames to send again, followed by new frames
+        return self.expired() + self.next_frames()
+
+    def ack(self, seq: int, cumulative: bool = False) -> int:
+        if not cumulative:
+            return 0 if self._in_flight.pop(seq, None) is None else 1
+        released = 0
+        while self._in_flight and next(iter(self._in_flight)) <= seq:
+            self._in_flight.popitem(last=False)
+            released += 1
+        return released
+
+    def send(self, sender: Callable[[int, Union[str, bytes]], None]) -> int:
+        # Pass every frame that is due to sender, with its sequence number
+        frames = self.pending()
+        for seq, frame in frames:
+            sender(seq, frame)
+        return len(frames)
+
+    def requeue(self) -> int:
+        # Return unacknowledged frames to the front of the buffer, oldest first
+        frames = [entry[0] for entry in self._in_flight.values()]
+        self._in_flight.clear()
+        if not frames:
+            return 0
+        if self.buffer.pack_on_put:
+            self.buffer.putback(frames)
+        else:
+            self.buffer.extendleft(reversed([self.buffer._unpack(frame) for frame in frames]))
+        return len(frames)
+
+    def __len__(self) -> int:
+        return self.in_flight
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(seq={self.next_seq}, in_flight={self.in_flight}/{self.window})"
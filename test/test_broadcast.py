@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+
+import pytest
+
+from buffered.broadcast import BroadcastBuffer
+
+
+def test_broadcast_buffer():
+    buffer = BroadcastBuffer(maxlen=8)
+    sender = buffer.register("sender")
+    archive = buffer.register("archive")
+    buffer.put_many([1, 2, 3])
+    assert sender.lag == 3
+    assert sender.get() == 1
+    assert sender.dump() == [2, 3]
+    assert sender.empty()
+    # Records are kept until the slowest consumer has read them
+    assert len(buffer) == 3
+    assert archive.peek() == 1
+    assert archive.dump(2) == [1, 2]
+    assert len(buffer) == 1
+    assert archive.get() == 3
+    assert buffer.empty()
+    assert archive.get() is None
+    assert buffer.next_seq == 3
+    with pytest.raises(ValueError):
+        buffer.register("sender")
+
+
+def test_broadcast_buffer_lag_policy():
+    buffer = BroadcastBuffer(maxlen=3)
+    fast = buffer.register("fast")
+    slow = buffer.register("slow")
+    for i in range(5):
+        buffer.put(i)
+        fast.get()
+    assert slow.missed == 2
+    assert slow.lag == 3
+    assert slow.dump() == [2, 3, 4]
+    assert fast.missed == 0
+
+
+def test_broadcast_buffer_drop_policy():
+    buffer = BroadcastBuffer(maxlen=3, policy="drop")
+    fast = buffer.register("fast")
+    slow = buffer.register("slow")
+    for i in range(4):
+        buffer.put(i)
+        fast.get()
+    assert not slow.active
+    assert "slow" not in buffer.consumers
+    assert slow.dump() == []
+    assert fast.get() is None
+    assert buffer.empty()
+
+
+def test_broadcast_buffer_register():
+    buffer = BroadcastBuffer(maxlen=2)
+    assert buffer.put_many([1, 2, 3]) == [1]
+    late = buffer.register("late", from_oldest=False)
+    early = buffer.register("early")
+    assert late.lag == 0
+    assert early.dump() == [2, 3]
+    buffer.unregister("early")
+    buffer.put(4)
+    assert late.dump() == [4]
+    assert buffer.empty()
+
+
+def test_broadcast_buffer_unbounded():
+    buffer = BroadcastBuffer(maxlen=None)
+    consumer = buffer.register("consumer")
+    assert buffer.put_many(range(10000)) == []
+    assert not buffer.full()
+    assert consumer.lag == 10000
+    assert consumer.dump(3) == [0, 1, 2]
+
+
+def test_broadcast_buffer_without_consumers():
+    buffer = BroadcastBuffer(maxlen=None)
+    assert buffer.put_many([1, 2]) == [1, 2]
+    assert buffer.empty()
+    consumer = buffer.register("consumer")
+    buffer.put_many([3, 4])
+    buffer.unregister("consumer")
+    assert buffer.empty()
+    assert buffer.next_seq == 4
+    assert buffer.put(5) == [5]
+    assert buffer.empty()
+    assert consumer.lag == 0
+
+    buffer = BroadcastBuffer(maxlen=2)
+    assert buffer.put_many([1, 2, 3]) == [1]
+    assert buffer.register("consumer").dump() == [2, 3]
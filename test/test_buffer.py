@@ -6,6 +6,8 @@
 # Copyright © 2024 Davidson Engineering Ltd.
 # ---------------------------------------------------------------------------
 
+import pickle
+
 import pytest
 
 from buffered.buffer import Buffer
@@ -242,3 +244,120 @@ def test_buffer_strings():
     strings = ["hello", "world"]
     buffer = Buffer(strings)
     assert buffer.size() == 2
+
+
+def test_buffer_put_many():
+    buffer = Buffer(maxlen=4)
+    buffer.put_many([[1, 2], [3, 4], "hello"])
+    assert list(buffer) == [[1, 2], [3, 4], "hello"]
+    assert buffer.free() == 1
+    assert not buffer.full()
+    buffer.put_many([5])
+    assert buffer.full()
+    assert buffer.free() == 0
+
+
+def test_buffer_max_bytes():
+    buffer = Buffer(maxlen=10, max_bytes=10, sizer=len)
+    assert buffer.put_many(["abcd", "efgh"]) == []
+    assert buffer.nbytes == 8
+    assert buffer.has_room("ij")
+    assert not buffer.has_room("ijk")
+    assert buffer.put("ijk") == ["abcd"]
+    assert buffer.nbytes == 7
+    assert buffer.get() == "efgh"
+    assert buffer.nbytes == 3
+    assert buffer.putback("lmnopqr") == []
+    assert buffer.full()
+    assert buffer.dump() == ["lmnopqr", "ijk"]
+    assert buffer.nbytes == 0
+    with pytest.raises(ValueError):
+        buffer.put("a" * 11)
+
+
+def test_buffer_max_bytes_needs_sizer():
+    with pytest.raises(ValueError):
+        Buffer(max_bytes=1000)
+
+
+def test_buffer_max_bytes_with_maxlen():
+    buffer = Buffer(maxlen=2, max_bytes=100, sizer=len)
+    assert buffer.put_many(["a", "b", "c"]) == ["a"]
+    assert buffer.nbytes == 2
+    assert buffer.putback("d") == ["c"]
+    assert list(buffer) == ["d", "b"]
+    assert buffer.nbytes == 2
+
+
+def test_buffer_nbytes_copy():
+    buffer = Buffer(["abc", "de"], max_bytes=100, sizer=len)
+    buffer_copy = buffer.copy()
+    assert buffer_copy.nbytes == 5
+    assert buffer_copy.max_bytes == 100
+    assert Buffer(["abc"], sizer=len).nbytes == 3
+
+
+def test_buffer_nbytes_pickle():
+    buffer = pickle.loads(pickle.dumps(Buffer(["abc", "de"], maxlen=5, max_bytes=100, sizer=len)))
+    assert list(buffer) == ["abc", "de"]
+    assert buffer.maxlen == 5
+    assert buffer.nbytes == 5
+    assert buffer.get() == "abc"
+    assert buffer.nbytes == 2
+
+
+def test_buffer_max_bytes_accounting():
+    buffer = Buffer(["abc"], max_bytes=10, sizer=len)
+    buffer[0] = "abcdefghi"
+    assert buffer.nbytes == 9
+    with pytest.raises(ValueError):
+        buffer[0] = "a" * 11
+    assert buffer.get() == "abcdefghi"
+    assert buffer.nbytes == 0
+
+    class Record:
+        def __init__(self, size):
+            self.size = size
+
+        def __eq__(self, other):
+            return True
+
+    buffer = Buffer(max_bytes=10, sizer=lambda record: record.size)
+    buffer.put(Record(4))
+    buffer.remove(Record(1))
+    assert buffer.nbytes == 0
+
+    buffer = Buffer(max_bytes=10, sizer=len)
+    with pytest.raises(ValueError):
+        buffer.put([["a"], ["b"] * 11, ["c"]])
+    assert buffer.empty()
+    assert buffer.nbytes == 0
+
+
+def test_buffer_max_bytes_stored_sizes():
+    buffer = Buffer(max_bytes=100, sizer=len)
+    record = {"a": 1}
+    buffer.put(record)
+    record["b"] = 2
+    assert buffer.get() == {"a": 1, "b": 2}
+    assert buffer.nbytes == 0
+
+    buffer.put_many(["a", "bb", "ccc"])
+    buffer.rotate(1)
+    buffer.insert(1, "dddd")
+    del buffer[2]
+    assert list(buffer) == ["ccc", "dddd", "bb"]
+    assert buffer.nbytes == 9
+    buffer.reverse()
+    assert buffer.pop() == "ccc"
+    assert buffer.nbytes == 6
+
+
+def test_buffer_evicted():
+    buffer = Buffer(maxlen=2)
+    assert buffer.put(1) == []
+    assert buffer.put_many([2, 3, 4]) == [1, 2]
+    assert buffer.put(5) == [3]
+    assert buffer.putback(6) == [5]
+    assert buffer.putback([[7], [8]]) == [4, 6]
+    assert list(buffer) == [[8], [7]]
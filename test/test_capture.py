@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+
+import pytest
+
+from buffered.buffer import Buffer, PackagedBuffer
+from buffered.capture import CaptureReader, CaptureWriter
+from buffered.packager import SeparatorPackager
+
+sep_packager = SeparatorPackager(sep_major="|", sep_minor=":", terminator="\0")
+
+
+def test_capture(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    buffer = PackagedBuffer([["cpu", 0.5], ["cpu", 0.6]], packager=sep_packager)
+    with CaptureWriter(path) as writer:
+        writer.write_many(buffer.dump_packed(), timestamp=10.0)
+        assert writer.write(b"\x00\x01", timestamp=12.0) == 2
+    with CaptureWriter(path) as writer:
+        assert len(writer) == 3
+        writer.write("cpu:0.7|\0", timestamp=13.5)
+
+    with CaptureReader(path) as reader:
+        assert len(reader) == 4
+        assert reader[0] == "cpu:0.5|\0"
+        assert reader[-1] == "cpu:0.7|\0"
+        assert reader[2] == b"\x00\x01"
+        assert reader.timestamp(1) == 10.0
+        assert reader.seq_at(11.0) == 2
+        assert reader.seq_at(10.0) == 0
+        assert reader.seq_at(13.5) == 3
+        assert reader.seq_at(20.0) == 4
+        assert list(reader.between(10.5, 14.0)) == [
+            (12.0, b"\x00\x01"),
+            (13.5, "cpu:0.7|\0"),
+        ]
+        with pytest.raises(IndexError):
+            reader[4]
+
+
+def test_capture_replay(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    with CaptureWriter(path) as writer:
+        writer.write("cpu:0.5|\0", timestamp=0.0)
+        writer.write("cpu:0.6|\0", timestamp=1.0)
+        writer.write("cpu:0.7|\0", timestamp=3.0)
+
+    now = [0.0]
+    delays = []
+
+    def sleep(delay):
+        delays.append(delay)
+        now[0] += delay
+
+    with CaptureReader(path) as reader:
+        buffer = PackagedBuffer(packager=sep_packager)
+        assert reader.replay(buffer, speed=2.0, sleep=sleep, clock=lambda: now[0]) == 3
+        assert delays == [0.5, 1.0]
+        assert buffer.copy().dump_unpacked() == [["cpu", "0.5"], ["cpu", "0.6"], ["cpu", "0.7"]]
+        assert buffer.dump_packed() == ["cpu:0.5|\0", "cpu:0.6|\0", "cpu:0.7|\0"]
+
+        buffer = PackagedBuffer(packager=sep_packager, pack_on_put=True)
+        reader.replay(buffer)
+        assert buffer.dump_packed() == ["cpu:0.5|\0", "cpu:0.6|\0", "cpu:0.7|\0"]
+
+        buffer = Buffer()
+        reader.replay(buffer, stop=1)
+        assert list(buffer) == ["cpu:0.5|\0"]
+
+        sent = []
+        assert reader.replay(sent.append, start=1) == 2
+        assert sent == ["cpu:0.6|\0", "cpu:0.7|\0"]
+
+
+def test_capture_empty(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    CaptureWriter(path).close()
+    with CaptureReader(path) as reader:
+        assert len(reader) == 0
+        assert reader.replay(Buffer()) == 0
@@ -6,6 +6,11 @@
 # Copyright © 2024 Davidson Engineering Ltd.
 # ---------------------------------------------------------------------------
 
+import math
+import pickle
+
+import pytest
+
 from buffered.buffer import (
     PackagedBuffer,
 )
@@ -13,6 +18,7 @@ from buffered.packager import (
     SeparatorPackager,
     PicklerPackager,
     JSONPackager,
+    TimeSeriesPackager,
 )
 
 sep_packager = SeparatorPackager(sep_major="|", sep_minor=":", terminator="\0")
@@ -256,3 +262,288 @@ def test_packaged_buffer():
         ["cpu", "0.7", "1622555557.0"],
         ["cpu", "0.8", "1622555558.0"],
     ]
+
+
+def test_packaged_buffer_max_bytes():
+    buffer = PackagedBuffer(packager=json_packager, max_bytes=20)
+    buffer.put_many([[1, 2, 3], [4, 5, 6]])
+    assert buffer.nbytes == 20
+    assert buffer.put_many([[7]]) == [[1, 2, 3]]
+    assert buffer.nbytes == 14
+    assert buffer.dump_packed() == ["[4, 5, 6]\0", "[7]\0"]
+    assert buffer.nbytes == 0
+
+
+def test_packaged_buffer_pack_on_put_has_room():
+    buffer = PackagedBuffer(packager=json_packager, max_bytes=100, pack_on_put=True)
+    assert buffer.record_size(5) == 2
+    assert buffer.has_room(5)
+    assert buffer.has_room({"a": 1})
+    assert not buffer.has_room({"a": "x" * 200})
+
+
+def test_packaged_buffer_max_bytes_packs_once():
+    class CountingPackager(JSONPackager):
+        packed = 0
+
+        def pack(self, data, terminate=True):
+            self.packed += 1
+            return super().pack(data, terminate)
+
+    packager = CountingPackager()
+    buffer = PackagedBuffer(packager=packager, max_bytes=10000)
+    buffer.put_many([[i] for i in range(100)])
+    assert packager.packed == 100
+    buffer.dump_packed()
+    assert packager.packed == 200
+    assert buffer.nbytes == 0
+
+
+def test_packaged_buffer_pack_on_put():
+    buffer = PackagedBuffer(packager=sep_packager, pack_on_put=True)
+    buffer.put([("cpu", 0.5, 1622555555.0), ("memory", 0.6, 1622555556.0)])
+    buffer.put(("cpu", 0.7, 1622555557.0))
+    assert buffer.peek() == "cpu:0.5:1622555555.0|\0"
+    assert buffer.copy().dump_unpacked() == [
+        ["cpu", "0.5", "1622555555.0"],
+        ["memory", "0.6", "1622555556.0"],
+        ["cpu", "0.7", "1622555557.0"],
+    ]
+    packed = buffer.dump_packed(2)
+    assert packed == ["cpu:0.5:1622555555.0|\0", "memory:0.6:1622555556.0|\0"]
+    buffer.putback(packed)
+    assert buffer.next_packed(terminate=False) == "cpu:0.5:1622555555.0|"
+    assert buffer.dump_packed() == [
+        "memory:0.6:1622555556.0|\0",
+        "cpu:0.7:1622555557.0|\0",
+    ]
+
+
+def test_packaged_buffer_pack_on_put_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        buffer = PackagedBuffer(
+            packager=json_packager,
+            pack_on_put=True,
+            put_executor=executor,
+            max_bytes=100,
+            parallel_threshold=0,
+            parallel_chunksize=1,
+        )
+        buffer.put_many([[1, 2, 3], {"cpu": 0.5}])
+        assert buffer.nbytes == 23
+        buffer_copy = buffer.copy()
+        assert buffer_copy.put_executor is executor
+        assert buffer_copy.executor is None
+        assert buffer_copy.dump_packed() == ["[1, 2, 3]\0", '{"cpu": 0.5}\0']
+        assert buffer.dump_unpacked() == [[1, 2, 3], {"cpu": 0.5}]
+
+
+def test_packaged_buffer_parallel_dump():
+    from concurrent.futures import ProcessPoolExecutor
+
+    data = [("cpu", i / 10, 1622555555.0 + i) for i in range(100)]
+    expected = PackagedBuffer(data, packager=sep_packager).dump_packed()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        buffer = PackagedBuffer(
+            data, packager=sep_packager, parallel_threshold=0, parallel_chunksize=8
+        )
+        assert buffer.dump_packed(50, executor=executor) == expected[:50]
+        assert buffer.dump_packed(executor=executor, chunksize=7) == expected[50:]
+        assert buffer.empty()
+
+
+def test_packaged_buffer_parallel_dump_error():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        buffer = PackagedBuffer(
+            [[1], [2], {3}],
+            packager=json_packager,
+            executor=executor,
+            parallel_threshold=0,
+        )
+        with pytest.raises(TypeError):
+            buffer.dump_packed(chunksize=1)
+        assert list(buffer) == [[1], [2], {3}]
+
+
+def test_packaged_buffer_iter():
+    data = [["cpu", 0.5], ["memory", 0.6], ["cpu", 0.7]]
+    buffer = PackagedBuffer(data, packager=sep_packager)
+    packed = buffer.iter_packed(2)
+    assert len(buffer) == 3
+    assert next(packed) == "cpu:0.5|\0"
+    assert len(buffer) == 2
+    assert list(packed) == ["memory:0.6|\0"]
+    assert list(buffer.iter_unpacked()) == [["cpu", 0.7]]
+
+    buffer = PackagedBuffer(["cpu:0.5|\0", "cpu:0.6|\0"], packager=sep_packager)
+    assert list(buffer.iter_unpacked()) == [["cpu", "0.5"], ["cpu", "0.6"]]
+
+    buffer = PackagedBuffer(data, packager=sep_packager)
+    assert len(list(buffer.iter_packed(0))) == 3
+    buffer = PackagedBuffer(data, packager=sep_packager)
+    assert len(list(buffer.iter_unpacked(0))) == 3
+
+
+def test_packaged_buffer_reader():
+    import io
+    import shutil
+
+    buffer = PackagedBuffer([[1, 2, 3], [4, 5, 6], [7]], packager=json_packager)
+    reader = buffer.reader(max=2)
+    chunk = bytearray(4)
+    assert reader.readinto(chunk) == 4
+    assert chunk == b"[1, "
+    assert len(buffer) == 2
+    output = io.BytesIO()
+    shutil.copyfileobj(reader, output)
+    assert output.getvalue() == b"2, 3]\0[4, 5, 6]\0"
+    assert reader.read() == b""
+    assert list(buffer) == [[7]]
+
+
+def test_packaged_buffer_reader_bytes_frames():
+    buffer = PackagedBuffer([[1], [2], [3]], packager=pickler_packager, pack_on_put=True)
+    frames = list(buffer)
+    assert buffer.reader(max=0).read() == b"".join(frames)
+    assert buffer.empty()
+
+
+def test_packager_records():
+    from dataclasses import dataclass
+    from typing import NamedTuple
+
+    @dataclass
+    class Metric:
+        name: str
+        value: float
+        time: float
+
+    class Sample(NamedTuple):
+        name: str
+        value: int
+
+    @dataclass
+    class Tagged:
+        metric: Metric
+        tag: str
+
+    data = [Metric("cpu", 0.5, 1622555555.0), Metric("memory", 0.6, 1622555556.0)]
+    packager = JSONPackager(terminator="\0", record_type=Metric)
+    packed = packager.pack(data)
+    assert packed == '[["cpu", 0.5, 1622555555.0], ["memory", 0.6, 1622555556.0]]\0'
+    assert packager.unpack(packed) == data
+    assert packager.unpack(packager.pack(data[0])) == data[0]
+
+    packager = SeparatorPackager(sep_major="|", sep_minor=":", record_type=Metric)
+    packed = packager.pack(data)
+    assert packed == "cpu:0.5:1622555555.0|memory:0.6:1622555556.0|\n"
+    assert packager.unpack(packed) == data
+    packager = SeparatorPackager(record_type=Sample)
+    assert packager.unpack(packager.pack(Sample("cpu", 5))) == Sample("cpu", 5)
+
+    packager = PicklerPackager(terminator=b"", record_type=Sample)
+    samples = [Sample("cpu", 5), Sample("memory", 6)]
+    assert pickle.loads(packager.pack(samples)) == [("cpu", 5), ("memory", 6)]
+    assert packager.unpack(packager.pack(samples)) == samples
+    packager = PicklerPackager(terminator=b"", record_type=Metric)
+    assert packager.unpack(packager.pack(data[0])) == data[0]
+
+    packager = JSONPackager(record_type=Tagged)
+    tagged = Tagged(Metric("cpu", 0.5, 1622555555.0), "host")
+    assert packager.pack(tagged) == '[["cpu", 0.5, 1622555555.0], "host"]\n'
+    assert packager.unpack(packager.pack(tagged)) == tagged
+    assert packager.unpack(packager.pack([tagged, tagged])) == [tagged, tagged]
+
+
+def test_packaged_buffer_records():
+    from typing import NamedTuple
+
+    class Sample(NamedTuple):
+        name: list
+        value: int
+
+    buffer = PackagedBuffer(packager=JSONPackager(terminator="\0", record_type=Sample))
+    buffer.put(Sample(["cpu"], 5))
+    buffer.put([Sample(["cpu"], 6), Sample(["memory"], 7)])
+    assert len(buffer) == 3
+    assert buffer.copy().dump_unpacked() == [
+        Sample(["cpu"], 5),
+        Sample(["cpu"], 6),
+        Sample(["memory"], 7),
+    ]
+    assert buffer.dump_packed(1) == ['[["cpu"], 5]\0']
+
+
+def test_time_series_packager():
+    packager = TimeSeriesPackager(terminator=b"\0")
+    data = [
+        ("cpu", 0.5, 1622555555.0),
+        ("memory", 0.6, 1622555556.0),
+        ("cpu", 0.7, 1622555557.0),
+        ("cpu", 0.7, 1622555558.5),
+        ("disk", 12, 1622555559),
+        ("memory", float("inf"), 1622555560.0),
+    ]
+    packed = packager.pack(data)
+    assert isinstance(packed, bytes)
+    assert packed.endswith(b"\0")
+    unpacked = packager.unpack(packed)
+    assert unpacked == data
+    assert [type(value) for sample in unpacked for value in sample] == [
+        type(value) for sample in data for value in sample
+    ]
+    assert packager.unpack(packager.pack(data[0])) == data[0]
+
+
+def test_time_series_packager_types():
+    packager = TimeSeriesPackager()
+    data = [
+        ("up", True, 1),
+        ("up", False, 2),
+        ("mixed", 1, 1.5),
+        ("mixed", 2.5, 2),
+        ("mixed", False, 3.0),
+        ("zero", -0.0, -0.0),
+        ("zero", 0.0, 0.0),
+    ]
+    unpacked = packager.unpack(packager.pack(data))
+    assert unpacked == data
+    assert [type(value) for sample in unpacked for value in sample] == [
+        type(value) for sample in data for value in sample
+    ]
+    assert [math.copysign(1.0, sample[2]) for sample in unpacked[-2:]] == [-1.0, 1.0]
+    assert math.copysign(1.0, unpacked[-2][1]) == -1.0
+    with pytest.raises(ValueError):
+        packager.pack([("mixed", 2**53, 1.0), ("mixed", 0.5, 2.0)])
+    with pytest.raises(TypeError):
+        packager.pack(("name", "value", 1.0))
+
+
+def test_time_series_packager_compression():
+    packager = TimeSeriesPackager()
+    data = [("cpu", 0.5, 1622555555.0 + i) for i in range(100)]
+    packed = packager.pack(data)
+    assert packager.unpack(packed) == data
+    assert len(packed) < len(sep_packager.pack(data)) / 10
+
+
+def test_packaged_buffer_time_series():
+    data = [("cpu", 0.5, 1622555555.0), ("cpu", 0.6, 1622555556.0)]
+    buffer = PackagedBuffer(data, packager=TimeSeriesPackager())
+    packed = buffer.dump_packed_batch()
+    assert buffer.empty()
+    assert buffer.dump_packed_batch() is None
+    assert TimeSeriesPackager().unpack(packed) == data
+
+    buffer = PackagedBuffer(data, packager=TimeSeriesPackager(), pack_on_put=True)
+    assert TimeSeriesPackager().unpack(buffer.dump_packed_batch()) == data
+
+    buffer = PackagedBuffer(data, packager=sep_packager)
+    packed = buffer.dump_packed_batch()
+    buffer = PackagedBuffer(data, packager=sep_packager, pack_on_put=True)
+    assert buffer.dump_packed_batch() == packed
+    assert packed == "cpu:0.5:1622555555.0|cpu:0.6:1622555556.0|\0"
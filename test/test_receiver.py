@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+
+import asyncio
+
+import pytest
+
+from buffered.buffer import Buffer, PackagedBuffer
+from buffered.packager import JSONPackager, PicklerPackager, SeparatorPackager, TimeSeriesPackager
+from buffered.receiver import PackagedReceiverProtocol, start_receiver
+
+
+class FakeTransport:
+    def __init__(self):
+        self.paused = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+def feed(protocol, data):
+    view = protocol.get_buffer(len(data))
+    view[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+def test_receiver_partial_frames():
+    async def run():
+        buffer = Buffer()
+        protocol = PackagedReceiverProtocol(JSONPackager(terminator="\0"), buffer)
+        protocol.connection_made(FakeTransport())
+        feed(protocol, b'[1, 2, 3]\0[4, ')
+        assert list(buffer) == [[1, 2, 3]]
+        feed(protocol, b"5, 6]\0")
+        assert list(buffer) == [[1, 2, 3], [4, 5, 6]]
+
+    asyncio.run(run())
+
+
+def test_receiver_frame_split_across_reads():
+    async def run():
+        buffer = Buffer()
+        protocol = PackagedReceiverProtocol(JSONPackager(terminator="\r\n"), buffer)
+        protocol.connection_made(FakeTransport())
+        feed(protocol, b'["abc", ')
+        feed(protocol, b'"def"]\r')
+        assert protocol._searched == len(b'["abc", "def"]')
+        feed(protocol, b"\n[1]\r\n")
+        assert list(buffer) == [["abc", "def"], [1]]
+        assert protocol._searched == 0
+
+    asyncio.run(run())
+
+
+def test_receiver_rejects_empty_terminator():
+    with pytest.raises(ValueError):
+        PackagedReceiverProtocol(JSONPackager(terminator=""), Buffer())
+
+
+def test_receiver_rejects_binary_packagers():
+    with pytest.raises(ValueError):
+        PackagedReceiverProtocol(TimeSeriesPackager(), Buffer())
+    with pytest.raises(ValueError):
+        PackagedReceiverProtocol(PicklerPackager(terminator=b"\0"), Buffer())
+
+
+def test_receiver_backpressure():
+    async def run():
+        buffer = Buffer(maxlen=2)
+        packager = SeparatorPackager(sep_major="|", sep_minor=":", terminator="\0")
+        protocol = PackagedReceiverProtocol(packager, buffer, resume_interval=0.001)
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b"cpu:0.5|\0cpu:0.6|\0cpu:0.7|\0")
+        assert buffer.dump() == [["cpu", "0.5"], ["cpu", "0.6"]]
+        assert transport.paused
+        assert protocol.pending() == 1
+        await asyncio.sleep(0.01)
+        assert buffer.dump() == [["cpu", "0.7"]]
+        assert not transport.paused
+        assert protocol.pending() == 0
+
+    asyncio.run(run())
+
+
+def test_start_receiver():
+    async def run():
+        buffer = Buffer()
+        server = await start_receiver(JSONPackager(), buffer, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b'{"cpu": 0.5}\n{"cpu": 0.6}\n')
+        await writer.drain()
+        writer.close()
+        for _ in range(100):
+            if len(buffer) == 2:
+                break
+            await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+        assert list(buffer) == [{"cpu": 0.5}, {"cpu": 0.6}]
+
+    asyncio.run(run())
+
+
+def test_receiver_backpressure_max_bytes():
+    async def run():
+        buffer = Buffer(max_bytes=8, sizer=len)
+        protocol = PackagedReceiverProtocol(JSONPackager(), buffer)
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b'"abcd"\n"efgh"\n"ijkl"\n')
+        assert list(buffer) == ["abcd", "efgh"]
+        assert transport.paused
+        assert protocol.pending() == 1
+
+    asyncio.run(run())
+
+
+def test_receiver_pack_on_put_max_bytes():
+    async def run():
+        buffer = PackagedBuffer(packager=JSONPackager(), max_bytes=100, pack_on_put=True)
+        protocol = PackagedReceiverProtocol(JSONPackager(), buffer)
+        protocol.connection_made(FakeTransport())
+        feed(protocol, b'5\n{"a": 1}\n')
+        assert list(buffer) == ["5\n", '{"a": 1}\n']
+        assert buffer.nbytes == 11
+
+    asyncio.run(run())
+
+
+def test_receiver_oversized_record():
+    async def run():
+        buffer = Buffer(max_bytes=4, sizer=len)
+        protocol = PackagedReceiverProtocol(JSONPackager(), buffer)
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b'"abcdefgh"\n"abc"\n')
+        assert list(buffer) == ["abc"]
+        assert not transport.paused
+        assert protocol.pending() == 0
+
+    asyncio.run(run())
+
+
+def test_receiver_connection_lost():
+    async def run():
+        buffer = Buffer(maxlen=1)
+        protocol = PackagedReceiverProtocol(JSONPackager(), buffer)
+        protocol.connection_made(FakeTransport())
+        feed(protocol, b"1\n2\n")
+        assert protocol.pending() == 1
+        handle = protocol._resume_handle
+        protocol.connection_lost(None)
+        assert handle.cancelled()
+        assert protocol._resume_handle is None
+        assert protocol.pending() == 0
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Created By  : Matthew Davidson
+# Created Date: 2024-02-02
+# Copyright © 2024 Davidson Engineering Ltd.
+# ---------------------------------------------------------------------------
+
+from buffered.buffer import PackagedBuffer
+from buffered.packager import JSONPackager
+from buffered.window import DeliveryWindow
+
+json_packager = JSONPackager(terminator="\0")
+
+
+def test_delivery_window():
+    now = [0.0]
+    buffer = PackagedBuffer([[1], [2], [3], [4]], packager=json_packager)
+    window = DeliveryWindow(buffer, window=3, timeout=1.0, clock=lambda: now[0])
+    assert window.next_frames() == [(0, "[1]\0"), (1, "[2]\0"), (2, "[3]\0")]
+    assert window.in_flight == 3
+    assert window.next_frames() == []
+    assert window.ack(1) == 1
+    assert window.ack(1) == 0
+    assert window.pending() == [(3, "[4]\0")]
+    assert window.expired() == []
+    now[0] = 1.0
+    assert window.expired() == [(0, "[1]\0"), (2, "[3]\0"), (3, "[4]\0")]
+    assert window.expired() == []
+    assert window.ack(2, cumulative=True) == 2
+    assert window.in_flight == 1
+    buffer.put([5])
+    sent = []
+    now[0] = 2.0
+    assert window.send(lambda seq, frame: sent.append((seq, frame))) == 2
+    assert sent == [(3, "[4]\0"), (4, "[5]\0")]
+    assert window.ack(4, cumulative=True) == 2
+    assert window.in_flight == 0
+
+
+def test_delivery_window_max_attempts():
+    now = [0.0]
+    buffer = PackagedBuffer([[1]], packager=json_packager, pack_on_put=True)
+    window = DeliveryWindow(buffer, timeout=1.0, max_attempts=2, clock=lambda: now[0])
+    assert window.next_frames() == [(0, "[1]\0")]
+    now[0] = 1.0
+    assert window.expired() == [(0, "[1]\0")]
+    assert window.abandoned == []
+    now[0] = 2.0
+    assert window.expired() == []
+    assert window.in_flight == 0
+    assert window.abandoned == [0]
+
+
+def test_delivery_window_requeue():
+    buffer = PackagedBuffer([[1], [2], [3]], packager=json_packager)
+    window = DeliveryWindow(buffer, window=2)
+    window.next_frames()
+    assert window.requeue() == 2
+    assert list(buffer) == [[1], [2], [3]]
+
+    buffer = PackagedBuffer([[1], [2], [3]], packager=json_packager, pack_on_put=True)
+    window = DeliveryWindow(buffer, window=2)
+    window.next_frames()
+    assert window.requeue() == 2
+    assert buffer.dump_packed() == ["[1]\0", "[2]\0", "[3]\0"]